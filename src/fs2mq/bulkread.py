@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+from itertools import groupby, islice
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional, Protocol
+
+# -----------------------------
+# Page-cache friendly hashing
+# -----------------------------
+#
+# Hashing terabytes through the page cache pushes out the pages that the
+# other workloads on the host are using. In bulk mode we
+#
+#   - tell the kernel we read sequentially (bigger readahead),
+#   - drop the pages we pulled in once they are hashed (DONTNEED),
+#   - but leave files alone that were already cached before we came
+#     along: mincore() on the first page tells us before we read
+#     anything. (Probing every block does not work: our own readahead
+#     makes the next blocks look cached. RWF_NOWAIT reads do not work
+#     either: some kernels do the read anyway.)
+#
+# With direct=True the page cache is bypassed entirely (O_DIRECT). That
+# needs page-aligned buffers and offsets, and not every filesystem
+# supports it (tmpfs, some FUSE/NFS); we then fall back to bulk mode.
+
+_FADVISE = hasattr(os, "posix_fadvise")
+_O_DIRECT = getattr(os, "O_DIRECT", 0)
+
+
+def _load_libc() -> Optional[ctypes.CDLL]:
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.mmap.restype = ctypes.c_void_p
+        libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int,
+                              ctypes.c_int, ctypes.c_int, ctypes.c_long]
+        libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+        libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_char_p]
+        return libc
+    except (OSError, AttributeError, TypeError):
+        return None  # no mincore here: every file counts as not cached
+
+
+_LIBC = _load_libc()
+_MAP_FAILED = ctypes.c_void_p(-1).value
+
+
+def _fadvise(fd: int, offset: int, length: int, advice_name: str) -> None:
+    if _FADVISE:
+        try:
+            os.posix_fadvise(fd, offset, length, getattr(os, advice_name))
+        except OSError:
+            pass  # advice only; some filesystems refuse it
+
+
+def open_direct(p: str | Path) -> int:
+    """p opened for O_DIRECT reads, or -1 where the filesystem does not do that."""
+    if not _O_DIRECT:
+        return -1
+    try:
+        return os.open(p, os.O_RDONLY | _O_DIRECT)
+    except OSError as e:
+        if e.errno != errno.EINVAL:
+            raise
+        return -1
+
+
+def calc_sha256_bulk(
+    p: str | Path,
+    buf_size: int = 1024 * 1024,
+    progress: Optional[Callable[[], None]] = None,
+    direct: bool = False,
+) -> str:
+    """Same digest as calc_sha256, read without polluting the page cache."""
+    buf_size = max(mmap.PAGESIZE, buf_size - buf_size % mmap.PAGESIZE)
+    h = hashlib.sha256()
+
+    if direct:
+        fd = open_direct(p)
+        if fd >= 0:
+            try:
+                offset = _hash_direct(fd, h, buf_size, progress)
+            finally:
+                os.close(fd)
+            if offset is None:
+                return h.hexdigest()
+            # O_DIRECT gave up half way (EINVAL); go on with cached reads
+            return _hash_cached(p, h, buf_size, progress, offset)
+
+    return _hash_cached(p, h, buf_size, progress, 0)
+
+
+def _hash_direct(fd: int, h: "hashlib._Hash", buf_size: int,
+                 progress: Optional[Callable[[], None]]) -> Optional[int]:
+    """Hash fd with O_DIRECT. None when done, else the offset to resume at."""
+    buf = mmap.mmap(-1, buf_size)  # anonymous mmap = page aligned
+    try:
+        view = memoryview(buf)
+        offset = 0
+        while True:
+            try:
+                n = os.preadv(fd, [buf], offset)
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise
+                return offset
+            if n == 0:
+                return None
+            h.update(view[:n])
+            offset += n
+            if progress is not None:
+                progress()
+            if n < buf_size:
+                # short read: EOF, or an unaligned offset from here on
+                return offset
+    finally:
+        view.release()
+        buf.close()
+
+
+def is_cached(fd: int) -> bool:
+    """True if the first page of fd is in the page cache (someone uses the file)."""
+    if _LIBC is None:
+        return False
+    page = mmap.PAGESIZE
+    addr = _LIBC.mmap(None, page, mmap.PROT_READ, mmap.MAP_SHARED, fd, 0)
+    if addr in (None, _MAP_FAILED):
+        return False  # empty file, or not mappable
+    try:
+        vec = ctypes.create_string_buffer(1)
+        if _LIBC.mincore(addr, page, vec) != 0:
+            return False
+        return bool(vec.raw[0] & 1)
+    finally:
+        _LIBC.munmap(addr, page)
+
+
+def drop_cache(fd: int) -> None:
+    """Drop all cached pages of fd, including readahead we never hashed."""
+    _fadvise(fd, 0, 0, "POSIX_FADV_DONTNEED")
+
+
+def pread_uncached(fd: int, view: memoryview, offset: int, keep: bool = False) -> int:
+    """preadv into view and, unless keep, drop those pages again. 0 at EOF."""
+    n = os.preadv(fd, [view], offset)
+    if n and not keep:
+        _fadvise(fd, offset, n, "POSIX_FADV_DONTNEED")
+    return n
+
+
+def _hash_cached(p: str | Path, h: "hashlib._Hash", buf_size: int,
+                 progress: Optional[Callable[[], None]], offset: int) -> str:
+    view = memoryview(bytearray(buf_size))
+    fd = os.open(p, os.O_RDONLY)
+    try:
+        keep = is_cached(fd)
+        _fadvise(fd, 0, 0, "POSIX_FADV_SEQUENTIAL")
+        while True:
+            n = pread_uncached(fd, view, offset, keep)
+            if n == 0:
+                break
+            h.update(view[:n])
+            offset += n
+            if progress is not None:
+                progress()
+        if not keep:
+            drop_cache(fd)
+    finally:
+        os.close(fd)
+    return h.hexdigest()
+
+# -----------------------------
+# Seek-aware read scheduling
+# -----------------------------
+#
+# On spinning disks, hashing files in readdir order makes the head jump
+# all over the platter. Sorting pending files by where their data is
+# turns that into mostly forward movement. Where the data is comes from
+# FIEMAP (physical offset of the first extent); where FIEMAP is not
+# available, the inode number is a decent stand-in, because filesystems
+# tend to allocate data near the inode.
+
+_FS_IOC_FIEMAP = 0xC020660B  # _IOWR('f', 11, struct fiemap)
+_FIEMAP_HEADER = struct.Struct("=QQIIII")  # start, length, flags, mapped, count, reserved
+_FIEMAP_EXTENT_SIZE = 56
+
+
+def physical_offset(path: str) -> Optional[int]:
+    """Disk byte offset of the first extent of path, or None if unknown."""
+    req = bytearray(_FIEMAP_HEADER.size + _FIEMAP_EXTENT_SIZE)
+    _FIEMAP_HEADER.pack_into(req, 0, 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0)
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return None
+    try:
+        fcntl.ioctl(fd, _FS_IOC_FIEMAP, req, True)
+    except OSError:
+        return None  # not Linux, or the filesystem has no FIEMAP
+    finally:
+        os.close(fd)
+    if struct.unpack_from("=I", req, 20)[0] == 0:
+        return None  # empty or fully inline file
+    return struct.unpack_from("=Q", req, _FIEMAP_HEADER.size + 8)[0]
+
+
+class _Schedulable(Protocol):
+    dirpath: str
+    ino: int
+
+    @property
+    def path(self) -> str: ...
+
+
+def schedule(
+    entries: Iterable[_Schedulable],
+    by: str = "inode",
+    window: int = 4096,
+) -> Iterator[_Schedulable]:
+    """
+    Reorder entries by disk position, window entries at a time.
+
+    Only files of the same directory are reordered among each other, so
+    the walk order of directories (which the dir summaries rely on) is
+    kept, and at most window entries are held back.
+    """
+    use_fiemap = by == "extent"
+
+    def key(e: _Schedulable) -> tuple[int, int]:
+        if use_fiemap:
+            off = physical_offset(e.path)
+            if off is not None:
+                return (0, off)
+        return (1, e.ino)
+
+    for _, same_dir in groupby(entries, key=lambda e: e.dirpath):
+        while True:
+            batch = list(islice(same_dir, window))
+            if not batch:
+                break
+            batch.sort(key=key)
+            yield from batch
+
+# -----------------------------
+# END
+# -----------------------------
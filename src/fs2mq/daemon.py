@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, ClassVar, Optional, Tuple
+
+import pika
+
+from fs2mq.scanner import (
+    AmqpSink,
+    RabbitConfig,
+    ScanOptions,
+    ScanStats,
+    connect,
+    load_rabbit_cfg_from_env,
+    run_scan,
+)
+from fs2mq.sinks import NdjsonSink, Sink
+
+# -----------------------------
+# Job model
+# -----------------------------
+
+@dataclass(frozen=True)
+class ScanJob:
+    run_id: str
+    opts: ScanOptions
+
+
+@dataclass(frozen=True)
+class JobSummary:
+    type: str
+    run_id: str
+    host: str
+    root: str
+    status: str   # "ok" | "failed" | "error"
+    published: int
+    failed: int
+    scanned: int
+    elapsed: float
+    summaries: int = 0
+    timeouts: int = 0
+    suppressed: int = 0
+    error: Optional[str] = None
+
+    event_type: ClassVar[str] = "scan.done"
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+
+def parse_job(body: bytes, base: Optional[Path]) -> ScanJob:
+    """
+    Turn a control message into a ScanJob.
+
+    Message format (JSON):
+      {"root": "proj-1", "run_id": "...", "limit": 0, "dry_run": false,
+       "include": ["*.txt"], "exclude": ["*.tmp"],
+       "hash_mode": "sha256", "chunk_size_mib": 64, "emit_chunks": false,
+       "dir_summary": false, "summary_only": false, "max_memory_mib": 0,
+       "stat_timeout": 0, "read_timeout": 0, "io_workers": 4,
+       "slow_log": 10, "hash_workers": 0, "log_every": 0,
+       "bulk_read": false, "direct_io": false, "schedule": "walk",
+       "schedule_window": 4096}
+
+    Only "root" is required; the others default to the CLI defaults,
+    except log_every (0 = no progress lines, as many jobs share one log).
+    Relative roots are resolved against base, and with a base set the
+    root must stay inside it.
+    Raises ValueError on anything we cannot run, including fields of the
+    wrong type (null counts as missing).
+    """
+    try:
+        msg = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"job is not valid JSON: {e}") from e
+    if not isinstance(msg, dict) or not msg.get("root"):
+        raise ValueError("job must be a JSON object with a 'root'")
+
+    def field(key: str, types: tuple[type, ...], default: Any) -> Any:
+        v = msg.get(key)
+        if v is None:
+            return default
+        # bool is an int subclass; true is not a valid limit
+        if not isinstance(v, types) or (isinstance(v, bool) and bool not in types):
+            raise ValueError(f"'{key}' has the wrong type: {type(v).__name__}")
+        return v
+
+    def number(key: str, default: float = 0) -> float:
+        v = field(key, (int, float), default)
+        if v < 0:
+            raise ValueError(f"'{key}' must be >= 0")
+        return v
+
+    def flag(key: str) -> bool:
+        return field(key, (bool,), False)
+
+    root = Path(field("root", (str,), ""))
+    if base is not None:
+        root = (base / root).resolve()
+        if root != base and base not in root.parents:
+            raise ValueError(f"root escapes base directory: {root}")
+    else:
+        root = root.resolve()
+    if not root.is_dir():
+        raise ValueError(f"root is not a directory: {root}")
+
+    def patterns(key: str) -> Tuple[str, ...]:
+        v = field(key, (str, list), [])
+        if isinstance(v, str):
+            v = [v]
+        if not all(isinstance(x, str) for x in v):
+            raise ValueError(f"'{key}' must be a string or a list of strings")
+        return tuple(v)
+
+    hash_mode = field("hash_mode", (str,), "sha256")
+    if hash_mode not in ("sha256", "tree"):
+        raise ValueError(f"unknown hash_mode: {hash_mode}")
+    sched = field("schedule", (str,), "walk")
+    if sched not in ("walk", "inode", "extent"):
+        raise ValueError(f"unknown schedule: {sched}")
+    chunk_size_mib = field("chunk_size_mib", (int,), 64)
+    if chunk_size_mib < 1:
+        raise ValueError("chunk_size_mib must be >= 1")
+    hash_workers = field("hash_workers", (int,), 0)
+    if hash_workers < 0:
+        raise ValueError("hash_workers must be >= 0")
+    io_workers = field("io_workers", (int,), 4)
+    if io_workers < 1:
+        raise ValueError("io_workers must be >= 1")
+    schedule_window = field("schedule_window", (int,), 4096)
+    if schedule_window < 1:
+        raise ValueError("schedule_window must be >= 1")
+
+    opts = ScanOptions(
+        root=root,
+        limit=int(number("limit")),
+        dry_run=flag("dry_run"),
+        log_every=int(number("log_every")),
+        include=patterns("include"),
+        exclude=patterns("exclude"),
+        hash_mode=hash_mode,
+        chunk_size=chunk_size_mib * 1024 * 1024,
+        hash_workers=hash_workers,
+        emit_chunks=flag("emit_chunks"),
+        dir_summary=flag("dir_summary"),
+        summary_only=flag("summary_only"),
+        max_memory=int(number("max_memory_mib")) * 1024 * 1024,
+        stat_timeout=float(number("stat_timeout")),
+        read_timeout=float(number("read_timeout")),
+        io_workers=io_workers,
+        slow_log=float(number("slow_log", 10)),
+        bulk_read=flag("bulk_read"),
+        direct_io=flag("direct_io"),
+        schedule=sched,
+        schedule_window=schedule_window,
+    )
+    run_id = field("run_id", (str,), "") or str(uuid.uuid4())
+    return ScanJob(run_id=run_id, opts=opts)
+
+# -----------------------------
+# Worker connections
+# -----------------------------
+
+class WorkerChannels:
+    """
+    One warm AMQP connection per worker thread.
+
+    pika's BlockingConnection is not thread-safe, so workers cannot share
+    the control connection. Each worker keeps its own and reuses it for
+    every job it runs; a dead connection is replaced on the next job.
+    """
+
+    def __init__(self, cfg: RabbitConfig) -> None:
+        self._cfg = cfg
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: list[pika.BlockingConnection] = []
+
+    def get(self) -> pika.adapters.blocking_connection.BlockingChannel:
+        conn: Optional[pika.BlockingConnection] = getattr(self._local, "conn", None)
+        ch = getattr(self._local, "ch", None)
+        if conn is not None and conn.is_open and ch is not None and ch.is_open:
+            try:
+                # idle workers do not pump heartbeats; catch up before use
+                conn.process_data_events(time_limit=0)
+                return ch
+            except pika.exceptions.AMQPError as e:
+                print(f"[WARN] worker connection lost, reconnecting: {e!r}", file=sys.stderr)
+
+        conn, ch = connect(self._cfg)
+        self._local.conn, self._local.ch = conn, ch
+        with self._lock:
+            self._all.append(conn)
+        return ch
+
+    def close_all(self) -> None:
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            try:
+                if conn.is_open:
+                    conn.close()
+            except Exception:
+                pass
+
+# -----------------------------
+# Daemon
+# -----------------------------
+
+class ScanDaemon:
+    def __init__(
+        self,
+        cfg: RabbitConfig,
+        control_queue: str,
+        max_jobs: int = 4,
+        base: Optional[Path] = None,
+    ) -> None:
+        self.cfg = cfg
+        self.control_queue = control_queue
+        self.max_jobs = max_jobs
+        self.base = base
+        self.workers = WorkerChannels(cfg)
+        self.pool = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="fs2mq-job")
+        self.conn: Optional[pika.BlockingConnection] = None
+        self.ch: Optional[pika.adapters.blocking_connection.BlockingChannel] = None
+        self._consumer_tag: Optional[str] = None
+        self._running = 0       # jobs submitted and not done yet
+        self._stopping = False
+
+    # --- control side (runs on the main thread only) ---
+    #
+    # A job is acked as soon as it starts, not when it is done: the broker
+    # closes the channel of a consumer that holds a delivery longer than
+    # consumer_timeout (30 min by default), and would then hand a long
+    # scan out again and again. The outcome is reported by scan.done.
+    # To not take more jobs than we can run, we stop consuming while all
+    # --jobs slots are busy.
+
+    def _consume(self) -> None:
+        assert self.ch is not None
+        self._consumer_tag = self.ch.basic_consume(
+            queue=self.control_queue, on_message_callback=self._on_job
+        )
+
+    def _pause(self) -> None:
+        if self._consumer_tag is not None:
+            assert self.ch is not None
+            tag, self._consumer_tag = self._consumer_tag, None
+            self.ch.basic_cancel(tag)
+
+    def _on_job(self, ch, method, properties, body: bytes) -> None:
+        # an exception here would end the control loop and, as the message
+        # is still unacked, the restarted daemon would get it again
+        if self._stopping or self._running >= self.max_jobs:
+            # delivered before our basic_cancel reached the broker
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
+        try:
+            job = parse_job(body, self.base)
+        except ValueError as e:
+            print(f"[WARN] rejecting job: {e}", file=sys.stderr)
+            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+            return
+        except Exception as e:
+            print(f"[WARN] rejecting job: {type(e).__name__}: {e!r}", file=sys.stderr)
+            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+            return
+
+        try:
+            fut = self.pool.submit(self._run_job, job)
+        except RuntimeError as e:  # pool already shut down
+            print(f"[WARN] cannot start job run_id={job.run_id}: {e}", file=sys.stderr)
+            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=True)
+            return
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        print(f"[INFO] job accepted run_id={job.run_id} root={job.opts.root}", file=sys.stderr)
+        self._running += 1
+        if self._running >= self.max_jobs:
+            self._pause()
+        fut.add_done_callback(self._job_done)
+
+    def _job_done(self, fut: Future) -> None:
+        # called on the worker thread; channel work has to go through the control thread
+        assert self.conn is not None
+        self.conn.add_callback_threadsafe(self._slot_free)
+
+    def _slot_free(self) -> None:
+        self._running -= 1
+        if not self._stopping and self._consumer_tag is None:
+            self._consume()
+
+    def stop(self) -> None:
+        """Stop taking jobs; serve() returns once the running ones are done."""
+        self._stopping = True  # the control loop checks it at least once a second
+
+    # --- worker side ---
+
+    def _run_job(self, job: ScanJob) -> JobSummary:
+        ch: Optional[pika.adapters.blocking_connection.BlockingChannel] = None
+        try:
+            ch = self.workers.get()
+            sink: Sink = NdjsonSink() if job.opts.dry_run else AmqpSink(ch, self.cfg)
+            try:
+                stats = run_scan(job.opts, sink, run_id=job.run_id)
+            finally:
+                sink.close()
+            summary = _summary_from_stats(stats, status="ok" if stats.failed == 0 else "failed")
+        except Exception as e:
+            print(f"[ERROR] job run_id={job.run_id} crashed: {type(e).__name__}: {e!r}", file=sys.stderr)
+            summary = JobSummary(
+                type="scan.done", run_id=job.run_id, host="", root=str(job.opts.root),
+                status="error", published=0, failed=0, scanned=0, elapsed=0.0,
+                error=f"{type(e).__name__}: {e}",
+            )
+
+        print(
+            f"[INFO] done run_id={summary.run_id} status={summary.status} "
+            f"published={summary.published} failed={summary.failed} "
+            f"scanned={summary.scanned} elapsed={summary.elapsed:.2f}s",
+            file=sys.stderr,
+        )
+
+        try:
+            ch = ch if ch is not None and ch.is_open else self.workers.get()
+            AmqpSink(ch, self.cfg).emit(summary)
+        except Exception as e:
+            print(f"[ERROR] cannot publish summary run_id={job.run_id}: {e!r}", file=sys.stderr)
+        return summary
+
+    # --- lifecycle ---
+
+    def serve(self) -> None:
+        self.conn, self.ch = connect(self.cfg)
+        self.ch.queue_declare(queue=self.control_queue, durable=self.cfg.durable)
+        # jobs are acked on arrival, so this only bounds the deliveries in
+        # flight when we pause
+        self.ch.basic_qos(prefetch_count=1)
+        self._consume()
+
+        print(
+            f"[INFO] daemon ready queue={self.control_queue} jobs={self.max_jobs}",
+            file=sys.stderr,
+        )
+        try:
+            # not start_consuming(): that returns as soon as we pause
+            while not self._stopping:
+                self.conn.process_data_events(time_limit=1)
+            self._pause()
+            # keep heartbeats going while the running scans finish
+            while self._running > 0:
+                self.conn.process_data_events(time_limit=1)
+        finally:
+            self.pool.shutdown(wait=True)
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+            self.workers.close_all()
+
+
+def _summary_from_stats(stats: ScanStats, status: str) -> JobSummary:
+    return JobSummary(
+        type="scan.done",
+        run_id=stats.run_id,
+        host=stats.host,
+        root=stats.root,
+        status=status,
+        published=stats.published,
+        failed=stats.failed,
+        scanned=stats.scanned,
+        elapsed=round(stats.elapsed, 3),
+        summaries=stats.summaries,
+        timeouts=stats.timeouts,
+        suppressed=stats.suppressed,
+    )
+
+# -----------------------------
+# CLI
+# -----------------------------
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="fs2mq daemon: keep a warm RabbitMQ connection and run scan jobs from a control queue",
+    )
+    p.add_argument(
+        "--control-queue",
+        default=os.environ.get("CONTROL_QUEUE", "fs2mq.jobs"),
+        help="Queue to consume scan jobs from (default: $CONTROL_QUEUE or fs2mq.jobs)",
+    )
+    p.add_argument(
+        "--jobs",
+        type=int,
+        default=4,
+        help="Number of scans to run at once (default: 4)",
+    )
+    p.add_argument(
+        "--base",
+        type=Path,
+        default=None,
+        help="Resolve job roots against this directory and refuse roots outside it",
+    )
+    return p.parse_args(argv)
+
+
+def main() -> int:
+    args = parse_args()
+
+    if args.jobs < 1:
+        print("[ERROR] --jobs must be >= 1", file=sys.stderr)
+        return 2
+
+    base = args.base.resolve() if args.base is not None else None
+    if base is not None and not base.is_dir():
+        print(f"[ERROR] base is not a directory: {base}", file=sys.stderr)
+        return 2
+
+    try:
+        cfg = load_rabbit_cfg_from_env()
+    except RuntimeError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 2
+
+    daemon = ScanDaemon(cfg, args.control_queue, max_jobs=args.jobs, base=base)
+
+    def on_signal(signum: int, frame: Any) -> None:
+        print(f"[INFO] signal {signum}, finishing running jobs", file=sys.stderr)
+        daemon.stop()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    try:
+        daemon.serve()
+    except pika.exceptions.AMQPError as e:
+        print(f"[ERROR] RabbitMQ connection/declare failed: {type(e).__name__}: {e!r}", file=sys.stderr)
+        return 3
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
+
+# -----------------------------
+# END
+# -----------------------------
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Generic, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# -----------------------------
+# Per-operation deadlines
+# -----------------------------
+#
+# A read on a stale NFS handle or a dying disk can block for ever, and a
+# thread stuck in such a syscall cannot be interrupted. So we do not try
+# to cancel it: we stop waiting for it, report the file as timed out and
+# start a fresh worker in its place. The stuck thread exits by itself if
+# the syscall ever returns.
+
+class TimedOut(Exception):
+    def __init__(self, op: str, elapsed: float) -> None:
+        super().__init__(f"{op} timed out after {elapsed:.1f}s")
+        self.op = op
+        self.elapsed = elapsed
+
+
+class Task(Generic[T]):
+    """
+    One item in flight. The work function reports which operation it is
+    in with begin() and that it is still making progress with touch().
+    """
+
+    __slots__ = ("item", "phase", "timeout", "deadline", "queued", "started",
+                 "result", "elapsed", "finished", "abandoned", "done")
+
+    def __init__(self, item: T) -> None:
+        self.item = item
+        self.phase = "queued"
+        self.timeout = 0.0
+        self.deadline: Optional[float] = None  # None = no deadline (yet)
+        self.queued = time.monotonic()
+        self.started: Optional[float] = None
+        self.result: Any = None
+        self.elapsed = 0.0
+        self.finished = False
+        self.abandoned = False
+        self.done = threading.Event()
+
+    def begin(self, phase: str, timeout: float) -> None:
+        """Start operation phase; it has to finish (or touch()) within timeout (0 = none)."""
+        now = time.monotonic()
+        self.phase = phase
+        self.timeout = timeout
+        self.deadline = now + timeout if timeout > 0 else None
+        if self.started is None:
+            self.started = now
+
+    def touch(self) -> None:
+        """Still making progress: push the deadline of the current phase out."""
+        if self.timeout > 0:
+            self.deadline = time.monotonic() + self.timeout
+
+
+class DeadlinePool(Generic[T]):
+    """
+    Worker threads that run fn(item, task) and give results back in
+    input order, never waiting on an item longer than its deadline.
+
+    Results are yielded in input order (the directory aggregation needs
+    the walk order), so a hung item holds back the ones behind it only
+    until its deadline passes. Then it is yielded as TimedOut and the
+    worker running it is replaced. At most max_stragglers workers are
+    replaced; past that a dead mount would only pile up threads. Once
+    no worker is left, nothing would ever run the queued items, so they
+    (and all further ones) are yielded as TimedOut("queued") at once.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[T, Task[T]], Any],
+        workers: int = 4,
+        max_stragglers: int = 64,
+    ) -> None:
+        self._fn = fn
+        self._q: queue.SimpleQueue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._live = 0
+        self._stragglers = 0
+        self._max_stragglers = max_stragglers
+        self._closed = False
+        for _ in range(workers):
+            self._spawn()
+
+    def _spawn(self) -> None:
+        self._live += 1
+        threading.Thread(target=self._work, name="fs2mq-io", daemon=True).start()
+
+    def _work(self) -> None:
+        while True:
+            task: Optional[Task[T]] = self._q.get()
+            if task is None:
+                return
+            if self._closed or task.abandoned:
+                continue
+            t0 = time.monotonic()
+            try:
+                result: Any = self._fn(task.item, task)
+            except Exception as e:
+                result = e
+            with self._lock:
+                task.result = result
+                task.elapsed = time.monotonic() - t0
+                task.finished = True
+                abandoned = task.abandoned
+            task.done.set()
+            if abandoned:
+                return  # a replacement worker has taken our place
+
+    def _abandon_expired(self, pending: deque) -> None:
+        now = time.monotonic()
+        for task in pending:
+            deadline = task.deadline
+            if deadline is None or now <= deadline or task.abandoned:
+                continue
+            with self._lock:
+                if task.finished:
+                    continue
+                task.abandoned = True
+                task.elapsed = now - (task.started or now)
+                self._live -= 1
+                self._stragglers += 1
+                if self._stragglers <= self._max_stragglers:
+                    self._spawn()
+                elif self._stragglers == self._max_stragglers + 1:
+                    print(
+                        f"[WARN] {self._stragglers} workers hung, not replacing any more",
+                        file=sys.stderr,
+                    )
+                if self._live == 0:
+                    print("[WARN] no workers left, failing the remaining files",
+                          file=sys.stderr)
+
+    def _starve(self, task: Task[T]) -> bool:
+        """With no worker left, give up on task if it has not started. True if so."""
+        with self._lock:
+            if self._live > 0 or task.started is not None:
+                return False
+            task.abandoned = True
+            task.elapsed = time.monotonic() - task.queued
+            return True
+
+    def run(self, items: Iterable[T], window: int) -> Iterator[Tuple[T, Any, float]]:
+        """
+        Yield (item, result, seconds) in input order. result is the
+        return value of fn, the exception it raised, or TimedOut.
+        """
+        pending: deque[Task[T]] = deque()
+        it = iter(items)
+        exhausted = False
+        while True:
+            while not exhausted and len(pending) < window:
+                try:
+                    item = next(it)
+                except StopIteration:
+                    exhausted = True
+                    break
+                task: Task[T] = Task(item)
+                pending.append(task)
+                self._q.put(task)
+
+            if not pending:
+                return
+
+            self._abandon_expired(pending)
+            head = pending[0]
+            if head.done.is_set():
+                pending.popleft()
+                yield head.item, head.result, head.elapsed
+            elif head.abandoned or self._starve(head):
+                pending.popleft()
+                yield head.item, TimedOut(head.phase, head.elapsed), head.elapsed
+            else:
+                head.done.wait(timeout=0.05)
+
+    def close(self) -> None:
+        """Drop queued work and let the workers exit. Hung ones stay behind."""
+        self._closed = True
+        with self._lock:
+            live = self._live
+        for _ in range(live):
+            self._q.put(None)
+
+# -----------------------------
+# Daemon thread executor
+# -----------------------------
+
+class DaemonThreadPool(Executor):
+    """
+    A ThreadPoolExecutor on daemon threads.
+
+    concurrent.futures joins its worker threads when the interpreter
+    exits, whatever shutdown(wait=False) said, so a single chunk read hung
+    on a dead mount would keep the process alive for ever. Daemon threads
+    are simply left behind, like the hung workers of DeadlinePool.
+    """
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "fs2mq-pool") -> None:
+        if max_workers <= 0:
+            raise ValueError("max_workers must be greater than 0")
+        self._q: queue.SimpleQueue = queue.SimpleQueue()
+        self._shutdown = False
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{thread_name_prefix}_{i}", daemon=True)
+            for i in range(max_workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _work(self) -> None:
+        while True:
+            item = self._q.get()
+            if item is None:
+                return
+            fut, fn, args, kwargs = item
+            if not fut.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                fut.set_exception(e)
+            else:
+                fut.set_result(result)
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        if self._shutdown:
+            raise RuntimeError("cannot schedule new futures after shutdown")
+        fut: Future = Future()
+        self._q.put((fut, fn, args, kwargs))
+        return fut
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self._shutdown = True
+        if cancel_futures:
+            while True:
+                try:
+                    item = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[0].cancel()
+        for _ in self._threads:
+            self._q.put(None)
+        if wait:
+            for t in self._threads:
+                t.join()
+
+# -----------------------------
+# END
+# -----------------------------
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from dataclasses import asdict, dataclass
+from typing import ClassVar, Optional
+
+# -----------------------------
+# Directory summary event
+# -----------------------------
+
+@dataclass(frozen=True, slots=True)
+class DirSummaryEvent:
+    run_id: str
+    host: str
+    root: str
+    path: str
+    total_bytes: int         # whole subtree
+    file_count: int          # whole subtree
+    dir_count: int           # subdirectories in the subtree with a file below them
+    newest_mtime_epoch: int  # 0 if no file below
+    tree_hash: str
+    # files in file_count that could not be hashed (read error, timeout);
+    # their size is in total_bytes as far as known, but not in tree_hash
+    incomplete_count: int = 0
+
+    event_type: ClassVar[str] = "dir.summary"
+
+    def to_json(self) -> str:
+        return json.dumps({"type": self.event_type, **asdict(self)}, ensure_ascii=False)
+
+# -----------------------------
+# Bottom-up aggregation
+# -----------------------------
+#
+# tree_hash of a directory is the sum (mod 2**256) of
+#   sha256("f" 0x00 name 0x00 file sha256)   for each file
+#   sha256("d" 0x00 name 0x00 dir tree_hash) for each subdirectory
+# A sum does not depend on the order the walk returns entries in, so we
+# never have to keep or sort a directory's children.
+
+_MOD = 1 << 256
+
+
+def _child_term(kind: bytes, name: str, digest: str) -> int:
+    h = hashlib.sha256(kind + b"\x00" + os.fsencode(name) + b"\x00" + digest.encode("ascii"))
+    return int.from_bytes(h.digest(), "big")
+
+
+class _OpenDir:
+    __slots__ = ("path", "total_bytes", "file_count", "dir_count", "newest", "acc",
+                 "incomplete")
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.total_bytes = 0
+        self.file_count = 0
+        self.dir_count = 0
+        self.newest = 0
+        self.acc = 0
+        self.incomplete = 0
+
+
+def _prefix(path: str) -> str:
+    return path if path.endswith(os.sep) else path + os.sep
+
+
+class DirAggregator:
+    """
+    Fold files into per-directory totals while the walk is running.
+
+    Files must arrive in depth-first order (what os.walk gives us): all
+    files below a directory come before anything outside it. Only the
+    directories on the path from root to the current file are kept open,
+    so memory grows with tree depth, not with the number of files. A
+    directory is finished (and returned) as soon as the walk leaves it.
+
+    Directories without any file below them produce no summary.
+    Files that could not be hashed are still added (sha256=None): they
+    count towards the totals and incomplete_count, not the tree_hash.
+    """
+
+    def __init__(self, run_id: str, host: str, root: str) -> None:
+        self.run_id = run_id
+        self.host = host
+        self.root = root
+        self._stack: list[_OpenDir] = [_OpenDir(root)]
+
+    def add_file(self, dirpath: str, name: str, size: int, mtime_epoch: int,
+                 sha256: Optional[str]) -> list[DirSummaryEvent]:
+        done = self._enter(dirpath)
+        top = self._stack[-1]
+        top.total_bytes += size
+        top.file_count += 1
+        top.newest = max(top.newest, mtime_epoch)
+        if sha256 is None:
+            top.incomplete += 1
+        else:
+            top.acc = (top.acc + _child_term(b"f", name, sha256)) % _MOD
+        return done
+
+    def close(self) -> list[DirSummaryEvent]:
+        """Finish every directory that is still open, root last."""
+        done: list[DirSummaryEvent] = []
+        while self._stack:
+            done.append(self._pop())
+        return done
+
+    def _enter(self, dirpath: str) -> list[DirSummaryEvent]:
+        done: list[DirSummaryEvent] = []
+        # leave directories that dirpath is not inside of
+        while len(self._stack) > 1:
+            top = self._stack[-1].path
+            if dirpath == top or dirpath.startswith(_prefix(top)):
+                break
+            done.append(self._pop())
+
+        # open the directories between the current one and dirpath
+        top = self._stack[-1].path
+        if dirpath != top:
+            cur = top
+            for part in dirpath[len(_prefix(top)):].split(os.sep):
+                cur = os.path.join(cur, part)
+                self._stack.append(_OpenDir(cur))
+        return done
+
+    def _pop(self) -> DirSummaryEvent:
+        d = self._stack.pop()
+        evt = DirSummaryEvent(
+            run_id=self.run_id,
+            host=self.host,
+            root=self.root,
+            path=d.path,
+            total_bytes=d.total_bytes,
+            file_count=d.file_count,
+            dir_count=d.dir_count,
+            newest_mtime_epoch=d.newest,
+            tree_hash=f"{d.acc:064x}",
+            incomplete_count=d.incomplete,
+        )
+        if self._stack:
+            parent = self._stack[-1]
+            parent.total_bytes += d.total_bytes
+            parent.file_count += d.file_count
+            parent.dir_count += d.dir_count + 1
+            parent.newest = max(parent.newest, d.newest)
+            parent.incomplete += d.incomplete
+            parent.acc = (parent.acc + _child_term(b"d", os.path.basename(d.path), evt.tree_hash)) % _MOD
+        return evt
+
+# -----------------------------
+# END
+# -----------------------------
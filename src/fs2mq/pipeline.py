@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import os
+import queue
+import sys
+import threading
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# -----------------------------
+# Process memory
+# -----------------------------
+
+def current_rss() -> Optional[int]:
+    """Resident set size in bytes, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+# -----------------------------
+# Memory budget
+# -----------------------------
+
+class MemoryBudget:
+    """
+    Byte-counting gate between the directory walk and the publisher.
+
+    The walker acquire()s the (estimated) size of every entry it hands
+    over and blocks while the entries in flight would exceed the budget;
+    the publisher release()s them once the entry is published, so
+    entries held further down the pipeline (read scheduling, the
+    deadline workers) still count.
+
+    The in-flight budget is max_bytes minus the RSS at start. On top of
+    that, every check_every entries the real RSS is read; if it is above
+    max_bytes the walker waits until nothing is in flight any more.
+    An entry is always let through when nothing is in flight or the
+    consumer is waiting for one (starving()): a pipeline stage that needs
+    more input before it gives entries back must not deadlock the scan,
+    and neither may an interpreter that alone is over budget.
+    """
+
+    def __init__(self, max_bytes: int, check_every: int = 1024) -> None:
+        self.max_bytes = max_bytes
+        start = current_rss() or 0
+        self.limit = max(max_bytes - start, 1024 * 1024)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._check_every = check_every
+        self._count = 0
+        self._warned = False
+        self._starving = False
+
+    def acquire(self, n: int, stop: threading.Event) -> bool:
+        """Block until n bytes fit. False if stop was set while waiting."""
+        self._count += 1
+        over_rss = False
+        if self._count % self._check_every == 0:
+            rss = current_rss()
+            over_rss = rss is not None and rss > self.max_bytes
+            if over_rss and not self._warned:
+                print(
+                    f"[WARN] RSS {rss // (1024 * 1024)} MiB above --max-memory "
+                    f"{self.max_bytes // (1024 * 1024)} MiB, throttling the walk",
+                    file=sys.stderr,
+                )
+                self._warned = True
+
+        with self._cond:
+            while (self.in_flight > 0 and not self._starving
+                   and (over_rss or self.in_flight + n > self.limit)):
+                if stop.is_set():
+                    return False
+                self._cond.wait(timeout=0.1)
+            self.in_flight += n
+            self._starving = False
+            return not stop.is_set()
+
+    def release(self, n: int) -> None:
+        with self._cond:
+            self.in_flight -= n
+            self._cond.notify_all()
+
+    def starving(self) -> None:
+        """The consumer has nothing left to work on: let one more entry in."""
+        with self._cond:
+            self._starving = True
+            self._cond.notify_all()
+
+# -----------------------------
+# Prefetching walk
+# -----------------------------
+
+_DONE = object()
+_ERROR = object()
+
+
+def prefetch(
+    items: Iterable[T],
+    budget: MemoryBudget,
+    sizeof: Callable[[T], int],
+) -> Iterator[T]:
+    """
+    Run items (the directory walk) on a background thread and yield its
+    results in order.
+
+    The walk keeps running while we hash and publish, but only as far
+    ahead as the budget allows. An entry counts against the budget until
+    the consumer calls budget.release(sizeof(entry)), which it has to do
+    for every entry it gets, once it is done with it.
+    """
+    q: queue.SimpleQueue = queue.SimpleQueue()
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            for item in items:
+                n = sizeof(item)
+                if not budget.acquire(n, stop):
+                    return
+                q.put((item, n))
+        except BaseException as e:  # hand it to the consumer thread
+            q.put((_ERROR, e))
+        finally:
+            q.put((_DONE, 0))
+
+    t = threading.Thread(target=produce, name="fs2mq-walk", daemon=True)
+    t.start()
+    try:
+        while True:
+            try:
+                item, n = q.get_nowait()
+            except queue.Empty:
+                budget.starving()
+                item, n = q.get()
+            if item is _DONE:
+                break
+            if item is _ERROR:
+                raise n
+            yield item
+    finally:
+        # consumer stopped early (--limit, error): let the walker exit
+        stop.set()
+        t.join()
+
+# -----------------------------
+# END
+# -----------------------------
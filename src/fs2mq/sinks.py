@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import codecs
+import gzip
+import io
+import os
+import socket
+import sys
+from pathlib import Path
+from typing import IO, Optional, Protocol
+
+# -----------------------------
+# Sink interface
+# -----------------------------
+
+# File names that are not valid UTF-8 reach us as surrogate escapes
+# (PEP 383), e.g. b"bad\xff" as "bad\udcff". UTF-8 cannot encode those,
+# and writing the raw bytes would not be valid JSON. Lone surrogates only
+# ever occur inside JSON strings here, so we write them as JSON escapes
+# ("bad\\udcff"), the same as json.dumps(ensure_ascii=True) would.
+# json.loads() gives the surrogate back and os.fsencode() the original
+# bytes.
+ENCODING_ERRORS = "fs2mq.jsonescape"
+
+
+def _json_escape(e: UnicodeError) -> tuple[str, int]:
+    if not isinstance(e, UnicodeEncodeError):
+        raise e
+    return "".join(f"\\u{ord(c):04x}" for c in e.object[e.start:e.end]), e.end
+
+
+codecs.register_error(ENCODING_ERRORS, _json_escape)
+
+
+class Event(Protocol):
+    event_type: str
+
+    def to_json(self) -> str: ...
+
+
+class Sink:
+    """
+    Where scan events go.
+
+    emit() returns False when the event could not be delivered; the
+    caller counts that as a failed file. flush() is called at the end of
+    every scan and returns how many events emit() had accepted since the
+    last flush() but that were lost after all (a buffered batch that
+    could not be written). close() is called once when the sink is no
+    longer needed.
+    """
+
+    def emit(self, event: Event) -> bool:
+        raise NotImplementedError
+
+    def flush(self) -> int:
+        return 0
+
+    def close(self) -> None:
+        self.flush()
+
+
+class _BatchedSink(Sink):
+    """
+    Collect serialized lines and hand them to _write() in large batches.
+
+    One write per batch instead of one print() per file is what makes the
+    file based sinks fast.
+    """
+
+    def __init__(self, batch_lines: int = 4096) -> None:
+        self._batch_lines = batch_lines
+        self._lines: list[str] = []
+        self._lost = 0  # lines of failed batches not yet reported by flush()
+
+    def emit(self, event: Event) -> bool:
+        self._lines.append(event.to_json())
+        if len(self._lines) >= self._batch_lines:
+            lost = self._drain()
+            if lost:
+                # this event is reported by our return value, the rest of
+                # the batch by the next flush()
+                self._lost += lost - 1
+                return False
+        return True
+
+    def flush(self) -> int:
+        lost = self._lost + self._drain()
+        self._lost = 0
+        return lost
+
+    def _drain(self) -> int:
+        """Write the pending lines. Returns how many were lost (0 = all written)."""
+        if not self._lines:
+            return 0
+        n = len(self._lines)
+        self._lines.append("")  # trailing newline
+        data = "\n".join(self._lines)
+        self._lines = []
+        try:
+            self._write(data)
+            return 0
+        except OSError as e:
+            print(f"[ERROR] sink write failed, {n} events lost: {e}", file=sys.stderr)
+            return n
+
+    def _write(self, data: str) -> None:
+        raise NotImplementedError
+
+# -----------------------------
+# NDJSON (stdout or single file)
+# -----------------------------
+
+class NdjsonSink(_BatchedSink):
+    """One JSON object per line, to stdout (path=None) or to a file."""
+
+    def __init__(self, path: Optional[Path] = None, buffer_size: int = 1024 * 1024,
+                 batch_lines: int = 4096) -> None:
+        super().__init__(batch_lines)
+        if path is None:
+            sys.stdout.flush()
+            # own writer on fd 1 so we skip sys.stdout's line buffering
+            self._f: IO[str] = open(sys.stdout.fileno(), "w", encoding="utf-8",
+                                    errors=ENCODING_ERRORS, buffering=buffer_size,
+                                    closefd=False)
+        else:
+            self._f = open(path, "w", encoding="utf-8", errors=ENCODING_ERRORS,
+                           buffering=buffer_size)
+
+    def _write(self, data: str) -> None:
+        self._f.write(data)
+        # push every batch through, so a failed write is charged to the
+        # batch it belongs to
+        self._f.flush()
+
+    def flush(self) -> int:
+        lost = super().flush()
+        try:
+            self._f.flush()
+        except OSError as e:
+            print(f"[ERROR] sink flush failed: {e}", file=sys.stderr)
+        return lost
+
+    def close(self) -> None:
+        self.flush()
+        self._f.close()
+
+# -----------------------------
+# Rotated (optionally gzip) file series
+# -----------------------------
+
+class RotatingFileSink(_BatchedSink):
+    """
+    NDJSON split into <prefix>-00000.ndjson, <prefix>-00001.ndjson, ...
+
+    A new file is started once the current one holds max_bytes of
+    (uncompressed) data. With compress=True each file is gzip'ed; level 1
+    keeps compression from becoming the bottleneck.
+    """
+
+    def __init__(self, prefix: Path, max_bytes: int = 256 * 1024 * 1024,
+                 compress: bool = False, compresslevel: int = 1,
+                 buffer_size: int = 1024 * 1024, batch_lines: int = 4096) -> None:
+        super().__init__(batch_lines)
+        self._prefix = prefix
+        self._max_bytes = max_bytes
+        self._compress = compress
+        self._compresslevel = compresslevel
+        self._buffer_size = buffer_size
+        self._index = 0
+        self._written = 0
+        self._f: Optional[IO[str]] = None
+        self._raw: Optional[IO[bytes]] = None  # file under the gzip stream
+        prefix.parent.mkdir(parents=True, exist_ok=True)
+
+    def _open_next(self) -> IO[str]:
+        suffix = ".ndjson.gz" if self._compress else ".ndjson"
+        path = self._prefix.with_name(f"{self._prefix.name}-{self._index:05d}{suffix}")
+        self._index += 1
+        self._written = 0
+        if self._compress:
+            self._raw = raw = open(path, "wb", buffering=self._buffer_size)
+            gz = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=self._compresslevel)
+            return io.TextIOWrapper(gz, encoding="utf-8", errors=ENCODING_ERRORS)
+        return open(path, "w", encoding="utf-8", errors=ENCODING_ERRORS,
+                    buffering=self._buffer_size)
+
+    def _write(self, data: str) -> None:
+        if self._f is None or self._written >= self._max_bytes:
+            self._close_current()
+            self._f = self._open_next()
+        self._f.write(data)
+        self._f.flush()  # see NdjsonSink._write
+        self._written += len(data)
+
+    def _close_current(self) -> None:
+        if self._f is not None:
+            f, self._f = self._f, None
+            f.close()
+        if self._raw is not None:
+            # closing the GzipFile does not close the file it writes into
+            raw, self._raw = self._raw, None
+            raw.close()
+
+    def flush(self) -> int:
+        lost = super().flush()
+        if self._f is not None:
+            try:
+                self._f.flush()
+            except OSError as e:
+                print(f"[ERROR] sink flush failed: {e}", file=sys.stderr)
+        return lost
+
+    def close(self) -> None:
+        super().flush()
+        self._close_current()
+
+# -----------------------------
+# Unix domain socket
+# -----------------------------
+
+class UnixSocketSink(_BatchedSink):
+    """Stream NDJSON to a local collector listening on a Unix socket."""
+
+    def __init__(self, path: Path, batch_lines: int = 4096) -> None:
+        super().__init__(batch_lines)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(os.fspath(path))
+
+    def _write(self, data: str) -> None:
+        self._sock.sendall(data.encode("utf-8", ENCODING_ERRORS))
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self._sock.close()
+
+# -----------------------------
+# END
+# -----------------------------
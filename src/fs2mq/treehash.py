@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import errno
+import hashlib
+import mmap
+import os
+from concurrent.futures import Executor, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from fs2mq.bulkread import drop_cache, is_cached, open_direct, pread_uncached
+
+# -----------------------------
+# Chunked tree hash
+# -----------------------------
+#
+# A file is cut into fixed-size chunks. Each chunk is hashed on its own
+# (so chunks can be hashed on several cores at once), then the chunk
+# digests are combined pairwise into one root digest:
+#
+#   leaf  = sha256(0x00 || chunk bytes)
+#   node  = sha256(0x01 || left || right)
+#
+# An odd node at the end of a level is carried up unchanged. The 0x00/0x01
+# prefixes keep a leaf from ever being mistaken for an inner node. An empty
+# file is one empty chunk.
+
+TREE_ALGO = "sha256-tree"
+
+_LEAF = b"\x00"
+_NODE = b"\x01"
+
+
+@dataclass(frozen=True)
+class TreeHash:
+    algo: str
+    chunk_size: int
+    root: str                   # hex
+    chunks: tuple[str, ...]     # hex digest of every leaf, in file order
+
+
+def _hash_chunk(fd: int, offset: int, length: int, buf_size: int,
+                progress: Optional[Callable[[], None]] = None,
+                bulk: bool = False, keep: bool = False, direct_fd: int = -1,
+                cancelled: Optional[Callable[[], bool]] = None) -> bytes:
+    h = hashlib.sha256(_LEAF)
+    if cancelled is not None and cancelled():
+        return h.digest()  # nobody waits for this file any more
+    end = offset + length
+    view = memoryview(bytearray(buf_size)) if bulk else None
+    # O_DIRECT wants a page aligned buffer; an anonymous mmap is one
+    dbuf = mmap.mmap(-1, buf_size) if direct_fd >= 0 else None
+    dview = memoryview(dbuf) if dbuf is not None else None
+    try:
+        while offset < end:
+            want = min(buf_size, end - offset)
+            # pread does not move the shared file offset, so threads can share fd
+            if dview is not None:
+                try:
+                    n = os.preadv(direct_fd, [dview[:want]], offset)
+                except OSError as e:
+                    if e.errno != errno.EINVAL:
+                        raise
+                    dview.release()
+                    dview = None  # O_DIRECT refused: go on with fd
+                    continue
+                h.update(dview[:n])
+                if n < want:
+                    # EOF, or an unaligned offset from here on
+                    dview.release()
+                    dview = None
+            elif view is not None:
+                n = pread_uncached(fd, view[:want], offset, keep)
+                h.update(view[:n])
+            else:
+                data = os.pread(fd, want, offset)
+                n = len(data)
+                h.update(data)
+            if not n:  # file shrank while we were reading
+                break
+            offset += n
+            if progress is not None:
+                progress()
+            if cancelled is not None and cancelled():
+                break
+    finally:
+        if dview is not None:
+            dview.release()
+        if dbuf is not None:
+            dbuf.close()
+    return h.digest()
+
+
+def merkle_root(leaves: list[bytes]) -> bytes:
+    level = leaves
+    while len(level) > 1:
+        nxt = [
+            hashlib.sha256(_NODE + level[i] + level[i + 1]).digest()
+            for i in range(0, len(level) - 1, 2)
+        ]
+        if len(level) % 2:
+            nxt.append(level[-1])
+        level = nxt
+    return level[0]
+
+
+def calc_tree_hash(
+    p: str | Path,
+    chunk_size: int = 64 * 1024 * 1024,
+    pool: Optional[Executor] = None,
+    buf_size: int = 1024 * 1024,
+    progress: Optional[Callable[[], None]] = None,
+    bulk: bool = False,
+    direct: bool = False,
+    cancelled: Optional[Callable[[], bool]] = None,
+) -> TreeHash:
+    """
+    Tree hash of p. Chunks are hashed on pool if given, else one by one.
+
+    hashlib and os.pread both release the GIL, so a ThreadPoolExecutor
+    is enough to keep several cores busy on a single file. With bulk,
+    pages read are dropped from the page cache again; with direct, the
+    chunks are read with O_DIRECT where possible (see bulkread).
+    Once cancelled() returns True, chunks stop reading and the result is
+    garbage; it is meant for files the caller has given up on.
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be > 0")
+
+    bulk = bulk or direct  # what a chunk falls back to without O_DIRECT
+    fd = os.open(p, os.O_RDONLY)
+    direct_fd = -1
+    try:
+        # O_DIRECT offsets have to stay aligned from chunk to chunk
+        if direct and chunk_size % mmap.PAGESIZE == 0 and buf_size % mmap.PAGESIZE == 0:
+            direct_fd = open_direct(p)
+        keep = bulk and is_cached(fd)
+        size = os.fstat(fd).st_size
+        offsets = range(0, size, chunk_size) if size else range(1)
+        if pool is None:
+            leaves = [_hash_chunk(fd, off, chunk_size, buf_size, progress, bulk, keep,
+                                  direct_fd, cancelled)
+                      for off in offsets]
+        else:
+            futures = [pool.submit(_hash_chunk, fd, off, chunk_size, buf_size,
+                                   progress, bulk, keep, direct_fd, cancelled)
+                       for off in offsets]
+            # let every chunk finish before fd is closed, even if one failed
+            wait(futures)
+            leaves = [f.result() for f in futures]
+        if bulk and not keep:
+            drop_cache(fd)  # readahead the chunks did not consume
+    finally:
+        os.close(fd)
+        if direct_fd >= 0:
+            os.close(direct_fd)
+
+    return TreeHash(
+        algo=TREE_ALGO,
+        chunk_size=chunk_size,
+        root=merkle_root(leaves).hex(),
+        chunks=tuple(leaf.hex() for leaf in leaves),
+    )
+
+# -----------------------------
+# END
+# -----------------------------
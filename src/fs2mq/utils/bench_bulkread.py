@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+# =============================
+# Bulk hashing benchmark: throughput and page cache growth
+# =============================
+#
+#   uv run python src/fs2mq/utils/bench_bulkread.py ./bulk --files 256 --size-mib 8
+#
+# Creates (once) a directory of random files, then hashes it with each
+# read mode and reports MB/s and how much the host page cache ("Cached"
+# in /proc/meminfo) grew during the run.
+#
+# Run with --drop-caches (root only) to start every run with a cold
+# cache; otherwise later runs may find the files cached by earlier ones.
+# The seek gain of --schedule only shows on spinning disks.
+
+def _info(msg: str) -> None:
+    print(f"[INFO] {msg}")
+
+
+def create_files(base: Path, files: int, size: int) -> None:
+    base.mkdir(parents=True, exist_ok=True)
+    marker = base.with_name(base.name + ".files")
+    if marker.exists() and marker.read_text() == f"{files}x{size}":
+        _info(f"reusing {base}")
+        return
+
+    _info(f"creating {files} files of {size // (1024 * 1024)} MiB in {base}")
+    # interleave writes so readdir, inode and disk order differ
+    handles = [open(base / f"f{i:05d}.bin", "wb") for i in range(files)]
+    block = 1024 * 1024
+    for _ in range(0, size, block):
+        for f in handles:
+            f.write(os.urandom(block))
+    for f in handles:
+        f.close()
+    marker.write_text(f"{files}x{size}")
+
+
+def page_cache_bytes() -> Optional[int]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("Cached:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def drop_caches() -> None:
+    os.sync()
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Throughput and page cache use of the read modes")
+    p.add_argument("base", type=Path, help="directory to create / reuse")
+    p.add_argument("--files", type=int, default=256)
+    p.add_argument("--size-mib", type=int, default=8)
+    p.add_argument("--drop-caches", action="store_true",
+                   help="drop the page cache before every run (needs root)")
+    args = p.parse_args()
+
+    size = args.size_mib * 1024 * 1024
+    create_files(args.base, args.files, size)
+    total = args.files * size
+    root = str(args.base.resolve())
+
+    base_cmd = [sys.executable, "-m", "fs2mq.scanner", "--root", root,
+                "--sink", "ndjson", "--output", os.devnull, "--log-every", "0"]
+    runs = {
+        "default": [],
+        "bulk": ["--bulk-read"],
+        "bulk+inode": ["--bulk-read", "--schedule", "inode"],
+        "bulk+extent": ["--bulk-read", "--schedule", "extent"],
+        "direct": ["--direct-io"],
+    }
+
+    print(f"{'run':12s} {'MB/s':>8s} {'cache growth':>14s}")
+    for name, extra in runs.items():
+        if args.drop_caches:
+            drop_caches()
+        before = page_cache_bytes()
+        t0 = time.time()
+        subprocess.run(base_cmd + extra, check=True, stderr=subprocess.DEVNULL)
+        secs = time.time() - t0
+        after = page_cache_bytes()
+        growth = "n/a" if before is None or after is None else f"{(after - before) / 2**20:9.1f} MiB"
+        print(f"{name:12s} {total / secs / 1e6:8.1f} {growth:>14s}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# =============================
+# Peak RSS benchmark for huge flat directories
+# =============================
+#
+#   uv run python src/fs2mq/utils/bench_memory.py ./flat --entries 1000000
+#
+# Creates (once) a single directory with N empty files, then scans it in
+# child processes and reports each child's peak RSS:
+#
+#   os.walk   - just iterate os.walk (builds the full list of names)
+#   scanner   - fs2mq.scanner --dry-run into /dev/null
+#   budgeted  - same, with --max-memory
+#
+# Empty files keep the test about directory entries, not about hashing.
+
+def _info(msg: str) -> None:
+    print(f"[INFO] {msg}")
+
+
+def create_flat(base: Path, entries: int) -> None:
+    base.mkdir(parents=True, exist_ok=True)
+    marker = base.with_name(base.name + ".entries")
+    if marker.exists() and int(marker.read_text()) == entries:
+        _info(f"reusing {base} ({entries} entries)")
+        return
+
+    _info(f"creating {entries} files in {base}")
+    t0 = time.time()
+    # str paths: pathlib would intern every name, and the children forked
+    # later report our peak RSS as part of theirs
+    d = str(base)
+    for i in range(entries):
+        fd = os.open(os.path.join(d, f"f{i:09d}"), os.O_CREAT | os.O_WRONLY, 0o644)
+        os.close(fd)
+        if i and i % 1_000_000 == 0:
+            _info(f"  {i} files ({time.time() - t0:.0f}s)")
+    marker.write_text(str(entries))
+
+
+def peak_rss_mib(cmd: list[str]) -> tuple[float, float]:
+    """Run cmd, return (peak RSS in MiB, wall seconds)."""
+    t0 = time.time()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    _, status, ru = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode not in (0, 4):
+        raise SystemExit(f"[ERROR] {cmd} exited with {proc.returncode}")
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return ru.ru_maxrss / scale, time.time() - t0
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Peak RSS of scanning one huge flat directory")
+    p.add_argument("base", type=Path, help="directory to create / reuse")
+    p.add_argument("--entries", type=int, default=1_000_000)
+    p.add_argument("--max-memory", type=int, default=64, metavar="MIB",
+                   help="--max-memory for the budgeted run (default: 64)")
+    args = p.parse_args()
+
+    create_flat(args.base, args.entries)
+    root = str(args.base.resolve())
+    py = sys.executable
+
+    runs = {
+        "os.walk": [py, "-c",
+                    "import os, sys\n"
+                    "for _, _, names in os.walk(sys.argv[1]): pass", root],
+        "scanner": [py, "-m", "fs2mq.scanner", "--root", root, "--dry-run",
+                    "--sink", "ndjson", "--output", os.devnull, "--log-every", "0"],
+        "budgeted": [py, "-m", "fs2mq.scanner", "--root", root, "--dry-run",
+                     "--sink", "ndjson", "--output", os.devnull, "--log-every", "0",
+                     "--max-memory", str(args.max_memory)],
+    }
+
+    print(f"{'run':10s} {'peak RSS':>12s} {'time':>9s}")
+    for name, cmd in runs.items():
+        rss, secs = peak_rss_mib(cmd)
+        print(f"{name:10s} {rss:9.1f} MiB {secs:8.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())